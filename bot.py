@@ -0,0 +1,202 @@
+"""
+Simple Tetris bot which places pieces according to heuristic evaluation of the stack.
+"""
+import curses
+
+from game import PLAY_AREA_HEIGHT, PLAY_AREA_WIDTH, validate_positions, is_inside_stack, check_cleared_lines, \
+	clear_lines
+from pieces import get_positions_from_rotation
+
+ROTATE_KEY = ord('a')
+
+# weights of the heuristic taken from https://codemyroad.wordpress.com/2013/04/14/tetris-ai-the-near-perfect-player/
+AGGREGATE_HEIGHT_WEIGHT = -0.510066
+COMPLETE_LINES_WEIGHT = 0.760666
+HOLES_WEIGHT = -0.35663
+BUMPINESS_WEIGHT = -0.184483
+
+
+def bot_driver(board):
+	"""
+	Generator of key codes which plays given board. Placement is planned once per block (as soon as it is spawned),
+	after that the block is moved down until it is added to the stack.
+	"""
+	while True:
+		block = board['block']
+		keys, _ = best_placement(board['stack'], block.__class__)
+
+		for key in keys:
+			yield key
+
+		while board['block'] is block:
+			yield curses.KEY_DOWN
+
+
+def best_placement(stack, piece_class, next_piece_class=None):
+	"""
+	Finds the best placement of a piece which has just been spawned.
+	:param next_piece_class: if given, every placement is evaluated with the best following placement of the next piece
+	:return: tuple (keys, evaluation); keys lead the piece to its final column and orientation (piece needs to be moved
+	down afterwards), evaluation is None if every placement ends the game
+	"""
+	best_keys = []
+	best_evaluation = None
+
+	for keys, positions in find_placements(stack, piece_class):
+		if next_piece_class is None:
+			evaluation = evaluate_placement(stack, positions)
+		else:
+			evaluation = _evaluate_with_next_piece(stack, positions, next_piece_class)
+
+		if evaluation is not None and (best_evaluation is None or evaluation > best_evaluation):
+			best_keys = keys
+			best_evaluation = evaluation
+
+	return best_keys, best_evaluation
+
+
+def _evaluate_with_next_piece(stack, positions, next_piece_class):
+	placement = place(stack, positions)
+
+	if placement is None:
+		return None
+
+	placed_stack, cleared_lines_cnt = placement
+	_, evaluation = best_placement(placed_stack, next_piece_class)
+
+	if evaluation is None:
+		return None
+
+	# lines cleared by the current piece are not visible in the stack evaluated for the next piece
+	return evaluation + COMPLETE_LINES_WEIGHT * cleared_lines_cnt
+
+
+def find_placements(stack, piece_class):
+	"""
+	Generator of all placements reachable by a spawned piece with rotations followed by left/right moves. Yields tuples
+	(keys, positions) - keys leading to the placement and final positions of the piece after it is dropped.
+	"""
+	piece = piece_class()
+
+	if not validate_positions(piece.current_positions, stack):
+		# no room for the piece - the game is over
+		return
+
+	rotation_block = piece.rotation_block
+	orientation = piece.orientation
+	keys = []
+	checked_orientations = set()
+
+	while orientation not in checked_orientations:
+		checked_orientations.add(orientation)
+		yield from _shifted_placements(stack, rotation_block, orientation, keys)
+
+		piece.rotation_block = rotation_block
+		piece.orientation = orientation
+		piece.requested_orientation = None
+		positions = piece.rotate_clockwise()
+		# Square doesn't request any orientation
+		next_orientation = piece.requested_orientation or orientation
+
+		if validate_positions(positions, stack):
+			keys = keys + [ROTATE_KEY]
+		else:
+			# e.g. Long Bar can't be rotated in the spawn line - try again one line lower
+			lower_rotation_block = (rotation_block[0] + 1, rotation_block[1])
+
+			if not validate_positions(get_positions_from_rotation(lower_rotation_block, orientation), stack):
+				return
+
+			if not validate_positions(get_positions_from_rotation(lower_rotation_block, next_orientation), stack):
+				return
+
+			rotation_block = lower_rotation_block
+			keys = keys + [curses.KEY_DOWN, ROTATE_KEY]
+
+		orientation = next_orientation
+
+
+def _shifted_placements(stack, rotation_block, orientation, keys):
+	yield keys, _drop(stack, rotation_block, orientation)
+
+	for x_step, key in ((-1, curses.KEY_LEFT), (1, curses.KEY_RIGHT)):
+		y, x = rotation_block
+		shift_keys = list(keys)
+
+		while True:
+			x += x_step
+
+			if not validate_positions(get_positions_from_rotation((y, x), orientation), stack):
+				break
+
+			shift_keys.append(key)
+			yield list(shift_keys), _drop(stack, (y, x), orientation)
+
+
+def _drop(stack, rotation_block, orientation):
+	y, x = rotation_block
+
+	while not is_inside_stack(get_positions_from_rotation((y + 1, x), orientation), stack):
+		y += 1
+
+	return get_positions_from_rotation((y, x), orientation)
+
+
+def place(stack, positions):
+	"""
+	Adds given positions to a copy of the stack and clears completed lines.
+	:return: tuple (placed_stack, cleared_lines_cnt) or None if the placement ends the game
+	"""
+	affected_lines = set()
+	placed_stack = {
+		"positions": dict(stack['positions']),
+		"previous_positions": None
+	}
+
+	for position in positions:
+		placed_stack['positions'][position] = 0
+		line, _ = position
+		affected_lines.add(line)
+
+	if 1 in affected_lines:
+		return None
+
+	cleared_lines = check_cleared_lines(placed_stack, affected_lines)
+
+	if cleared_lines:
+		clear_lines(cleared_lines, placed_stack)
+
+	return placed_stack, len(cleared_lines)
+
+
+def evaluate_placement(stack, positions):
+	"""
+	Evaluates the stack after adding given positions to it (and clearing completed lines).
+	:return: evaluation (the higher the better) or None if the placement ends the game
+	"""
+	placement = place(stack, positions)
+
+	if placement is None:
+		return None
+
+	placed_stack, cleared_lines_cnt = placement
+
+	return evaluate_stack(placed_stack['positions'], cleared_lines_cnt)
+
+
+def evaluate_stack(positions, cleared_lines_cnt=0):
+	heights = [0] * PLAY_AREA_WIDTH
+
+	for y, x in positions:
+		heights[x] = max(heights[x], PLAY_AREA_HEIGHT + 1 - y)
+
+	# every empty cell below the top of its column is a hole
+	holes = sum(heights) - len(positions)
+	bumpiness = sum(abs(left - right) for left, right in zip(heights, heights[1:]))
+
+	return (
+		AGGREGATE_HEIGHT_WEIGHT * sum(heights) +
+		COMPLETE_LINES_WEIGHT * cleared_lines_cnt +
+		HOLES_WEIGHT * holes +
+		BUMPINESS_WEIGHT * bumpiness
+	)
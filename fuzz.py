@@ -0,0 +1,315 @@
+"""
+Fuzzer of the game rules.
+
+Headless boards are driven by random and adversarial key sequences (in many processes) and invariants of the game are
+checked after every step. Every step is a key together with a flag telling if the gravity interval was completed in the
+same cycle, as it happens in the game. Failing sequences are minimized and written as replay files (see wall.py) with
+the randomizer and seed needed to reproduce them in the header, so they can be checked again with --replay option or
+watched with:
+
+    python wall.py --randomizer <randomizer> --seed <seed> <replay file>
+"""
+import argparse
+import multiprocessing
+import os
+import random
+from itertools import islice
+from time import time
+
+from game import PLAY_AREA_HEIGHT, PLAY_AREA_WIDTH, new_board, play_step
+from randomizers import RANDOMIZERS, DEFAULT_RANDOMIZER, randomizer_gen
+from wall import REPLAY_KEYS, parse_replay_step, format_replay_step
+
+KEYS = list(REPLAY_KEYS.values())
+
+LEFT, RIGHT, DOWN = REPLAY_KEYS['left'], REPLAY_KEYS['right'], REPLAY_KEYS['down']
+ROTATIONS = (REPLAY_KEYS['a'], REPLAY_KEYS['d'])
+
+# maximal number of steps of a sequence (generated lazily - most sequences end by game over long before it)
+SEQUENCE_LENGTH = 5000
+# probability that the gravity interval is completed in the same cycle as the key is pressed
+TICK_PROBABILITY = 0.3
+# number of sequences checked by a worker before reporting back
+BATCH_SIZE = 20
+# number of batches sent to every worker at once
+ROUND_SIZE = 2
+
+
+def main(duration, workers=None, randomizer=DEFAULT_RANDOMIZER, output_dir=".", seed=None):
+	"""
+	Fuzzes the game for given number of seconds and writes minimized reproducers of found violations to output_dir.
+	"""
+	if seed is None:
+		seed = random.randrange(2 ** 32)
+
+	failures = dict()
+	steps_cnt = 0
+	batch_seed = seed
+	start = time()
+
+	if workers is None:
+		workers = os.cpu_count()
+
+	# batches are sent in rounds - pool would consume all of them at once otherwise
+	batches_cnt = ROUND_SIZE * workers
+
+	with multiprocessing.Pool(workers) as pool:
+
+		while time() - start < duration:
+			batches = [(batch_seed + i * BATCH_SIZE, randomizer) for i in range(batches_cnt)]
+			batch_seed += batches_cnt * BATCH_SIZE
+
+			for batch_steps_cnt, batch_failures in pool.imap_unordered(fuzz_batch, batches):
+				steps_cnt += batch_steps_cnt
+
+				for violation, steps, board_seed in batch_failures:
+					# one reproducer for each kind of violation is enough
+					failures.setdefault(violation.split(":")[0], (violation, steps, board_seed))
+
+	elapsed = time() - start
+	print(f"{steps_cnt} steps in {elapsed:.1f} s ({steps_cnt / elapsed * 60 / 1e6:.1f} M steps/min)")
+
+	for kind, (violation, steps, board_seed) in sorted(failures.items()):
+		steps = minimize(steps, randomizer, board_seed, kind)
+		path = os.path.join(output_dir, f"fuzz-{kind}-{board_seed}.replay")
+		write_reproducer(path, steps, randomizer, board_seed, violation)
+		print(f"{violation} - {len(steps)} steps reproducer written to {path}")
+
+	if not failures:
+		print("no violations found")
+
+
+def fuzz_batch(args):
+	"""
+	Runs BATCH_SIZE sequences - half of them random and half adversarial. Every sequence gets its own board seed.
+	:return: tuple (steps_cnt, failures), failures is a list of tuples (violation, steps, board_seed)
+	"""
+	batch_seed, randomizer = args
+	steps_cnt = 0
+	failures = list()
+
+	for board_seed in range(batch_seed, batch_seed + BATCH_SIZE):
+		rng = random.Random(board_seed)
+
+		if board_seed % 2:
+			steps = adversarial_steps(rng)
+		else:
+			steps = random_steps(rng)
+
+		played_steps = list()
+		failed_step, violation = run_sequence(
+			record_steps(islice(steps, SEQUENCE_LENGTH), played_steps), randomizer, board_seed
+		)
+
+		if violation:
+			steps_cnt += failed_step + 1
+			# sequence is stopped right after the violating step, so it is the last recorded one
+			failures.append((violation, played_steps, board_seed))
+		else:
+			steps_cnt += failed_step
+
+	return steps_cnt, failures
+
+
+def random_steps(rng):
+	while True:
+		yield rng.choice(KEYS), rng.random() < TICK_PROBABILITY
+
+
+def adversarial_steps(rng):
+	for key in adversarial_keys(rng):
+		yield key, rng.random() < TICK_PROBABILITY
+
+
+def record_steps(steps, played_steps):
+	for step in steps:
+		played_steps.append(step)
+		yield step
+
+
+def adversarial_keys(rng):
+	"""
+	Endless concatenation of key patterns which push pieces against the edges - rotations right after spawn (near the
+	top edge), rotations at the walls and right before landing.
+	"""
+	while True:
+		keys = list()
+		pattern = rng.randrange(4)
+		rotations = [rng.choice(ROTATIONS) for _ in range(rng.randrange(1, 5))]
+
+		if pattern == 0:
+			# rotations while the piece is still in the spawn line
+			keys.extend(rotations)
+		elif pattern == 1:
+			# rotations at the wall
+			keys.extend([rng.choice((LEFT, RIGHT))] * rng.randrange(PLAY_AREA_WIDTH))
+			keys.extend(rotations)
+		elif pattern == 2:
+			# rotations right above the stack
+			keys.extend([DOWN] * rng.randrange(PLAY_AREA_HEIGHT))
+			keys.extend(rotations)
+		else:
+			# landing
+			keys.extend([DOWN] * PLAY_AREA_HEIGHT)
+
+		yield from keys
+
+
+def run_sequence(steps, randomizer, seed):
+	"""
+	Plays given steps (iterable of tuples of key and interval_completed flag) on a new board until an invariant is
+	violated or the game is over.
+	:return: tuple (step, violation) - index of the step which violated an invariant and its description, or number of
+	played steps and None
+	"""
+	board = new_board(randomizer_gen(randomizer, seed))
+	# no steps played yet
+	step = -1
+
+	for step, (key, interval_completed) in enumerate(steps):
+		_, cleared_lines, game_over = play_step(board, key, interval_completed)
+
+		if game_over:
+			return step + 1, None
+
+		violation = check_invariants(board, cleared_lines)
+
+		if violation:
+			return step, violation
+
+	return step + 1, None
+
+
+def check_invariants(board, cleared_lines):
+	stack = board['stack']
+	positions = stack['positions']
+
+	for y, x in board['block'].current_positions:
+		if y <= 0:
+			return f"top_edge: block at {(y, x)}"
+
+		if y > PLAY_AREA_HEIGHT or x < 0 or x >= PLAY_AREA_WIDTH:
+			return f"out_of_bounds: block at {(y, x)}"
+
+		if (y, x) in positions:
+			return f"overlap: block at {(y, x)}"
+
+	if cleared_lines is None:
+		# stack is changed only when the block lands
+		return None
+
+	for y, x in positions:
+		if y <= 0 or y > PLAY_AREA_HEIGHT or x < 0 or x >= PLAY_AREA_WIDTH:
+			return f"stack_out_of_bounds: stack at {(y, x)}"
+
+	if cleared_lines:
+		return check_compaction(stack, cleared_lines)
+
+	return None
+
+
+def check_compaction(stack, cleared_lines):
+	# stack from before clearing lines is kept for drawing purposes
+	previous_positions = stack['previous_positions']
+	full_lines = {
+		line for line in range(1, PLAY_AREA_HEIGHT + 1)
+		if all((line, x) in previous_positions for x in range(PLAY_AREA_WIDTH))
+	}
+
+	if full_lines != set(cleared_lines):
+		return f"cleared_lines: cleared {sorted(cleared_lines)}, full {sorted(full_lines)}"
+
+	expected_positions = dict()
+
+	for (y, x), color in previous_positions.items():
+		if y not in full_lines:
+			# every remaining row falls by the number of cleared rows below it
+			expected_positions[(y + sum(1 for line in full_lines if line > y), x)] = color
+
+	if stack['positions'] != expected_positions:
+		return f"compaction: after clearing lines {sorted(cleared_lines)}"
+
+	return None
+
+
+def minimize(steps, randomizer, seed, kind):
+	"""
+	Removes as many steps as possible while the same kind of violation is still reproduced (ddmin-like).
+	"""
+	def fails(candidate):
+		_, violation = run_sequence(candidate, randomizer, seed)
+		return violation is not None and violation.split(":")[0] == kind
+
+	chunk_size = len(steps) // 2
+
+	while chunk_size > 0:
+		start = 0
+
+		while start < len(steps):
+			candidate = steps[:start] + steps[start + chunk_size:]
+
+			if fails(candidate):
+				steps = candidate
+			else:
+				start += chunk_size
+
+		chunk_size //= 2
+
+	# sequence ends with the violating step
+	failed_step, _ = run_sequence(steps, randomizer, seed)
+
+	return steps[:failed_step + 1]
+
+
+def write_reproducer(path, steps, randomizer, seed, violation):
+	with open(path, "w") as reproducer_file:
+		reproducer_file.write(f"# {violation}\n")
+		reproducer_file.write(f"# randomizer: {randomizer}\n")
+		reproducer_file.write(f"# seed: {seed}\n")
+		reproducer_file.write(" ".join(format_replay_step(key, interval_completed) for key, interval_completed in steps))
+		reproducer_file.write("\n")
+
+
+def read_reproducer(path):
+	"""
+	:return: tuple (steps, randomizer, seed)
+	"""
+	steps = list()
+	header = dict()
+
+	with open(path) as reproducer_file:
+		for line in reproducer_file:
+			if line.startswith("#"):
+				name, _, value = line[1:].partition(":")
+				header[name.strip()] = value.strip()
+				continue
+
+			steps.extend(parse_replay_step(step_name) for step_name in line.split())
+
+	return steps, header.get("randomizer", DEFAULT_RANDOMIZER), int(header["seed"])
+
+
+def replay(path):
+	steps, randomizer, seed = read_reproducer(path)
+	step, violation = run_sequence(steps, randomizer, seed)
+
+	if violation:
+		print(f"{violation} (step {step})")
+	else:
+		print(f"no violation in {step} steps")
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Fuzzes Tetris game rules with random and adversarial keys.")
+	parser.add_argument("-t", "--duration", type=float, default=60, help="fuzzing time in seconds")
+	parser.add_argument("-j", "--workers", type=int, help="number of worker processes (default: number of CPUs)")
+	parser.add_argument("--randomizer", choices=RANDOMIZERS, default=DEFAULT_RANDOMIZER, help="order of pieces")
+	parser.add_argument("--seed", type=int, help="seed of the first sequence")
+	parser.add_argument("-o", "--output", default=".", help="directory for reproducers")
+	parser.add_argument("--replay", help="re-checks given reproducer instead of fuzzing")
+	args = parser.parse_args()
+
+	if args.replay:
+		replay(args.replay)
+	else:
+		main(args.duration, args.workers, args.randomizer, args.output, args.seed)
@@ -1,99 +1,125 @@
+import argparse
 import curses
+import sys
 from time import time, sleep
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
 
 from pieces import *
+from profiler import setup_profiler
+from randomizers import RANDOMIZERS, DEFAULT_RANDOMIZER, randomizer_gen
+from shared_state import setup_shared_state
 
 
-def main(stdscr):
+def main(stdscr, randomizer=DEFAULT_RANDOMIZER, seed=None, practice=False, shared_state_name=None):
 	"""
 	Main function which controls Tetris game logic.
 	:param stdscr: standard curses screen; will be supplied by wrapper function
+	:param randomizer: name of the randomizer which decides about the order of pieces
+	:param seed: seed of the randomizer; random if not given
+	:param practice: if True placed pieces can be undone
+	:param shared_state_name: if given, state of the game is published in the shared memory block of this name and keys
+	are read from its input buffer (see shared_state.py)
 	"""
 	setup_main_window(stdscr)
 	height, width = stdscr.getmaxyx()
 
+	board = new_board(randomizer_gen(randomizer, seed))
+	history = new_history()
+
 	play_window = setup_play_window(width)
-	stats = setup_statistics(width)
+	stats = setup_statistics(width, board['statistics'])
 	next_piece_window = setup_next_piece_window(width)
-	time_interval, score = setup_score(width)
-	setup_help(width)
+	time_interval, score = setup_score(width, board['score'])
+	setup_help(width, practice)
 
-	block = get_random_piece()()
-	stats.send(block)
-	next_piece = get_random_piece()
+	# shared state is created before the profiler starts - nothing needs to be cleaned up if it fails
+	try:
+		shared_state = setup_shared_state(shared_state_name) if shared_state_name else None
+	except FileExistsError:
+		sys.exit(f"shared memory block {shared_state_name} already exists - is another game using the same name?")
 
-	draw_next_piece(next_piece_window, next_piece)
-	draw_piece(play_window, block)
+	profiler = setup_profiler()
 
-	stack = {
-		"positions": dict(),
-		"previous_positions": None
-	}
+	stats.send(board['block'])
+	# snapshot includes statistics of the spawned block
+	save_snapshot(history, board)
+
+	draw_next_piece(next_piece_window, board['next_piece'])
+	draw_piece(play_window, board['block'])
+	curses.doupdate()
 
 	timer = time()
+	board_changed = True
+
+	try:
+		while True:
+			# this method is non-blocking (set in setup_main_window)
+			c = stdscr.getch()
+
+			if shared_state is not None:
+				# key sent by a bot is played only when no key was pressed - other keys wait in the input buffer
+				bot_key = shared_state.send((board if board_changed else None, c == -1))
+
+				if c == -1:
+					c = bot_key
+
+			board_changed = False
+
+			if c == ord('p'):
+				profiler.send(c)
+			elif c == ord('u') and practice and rewind(history, board):
+				time_interval = score.send(0)
+				stats.send(None)
+				draw_next_piece(next_piece_window, board['next_piece'])
+				# falling block is erased together with the whole play area
+				play_window.erase()
+				play_window.border()
+				draw_stack(play_window, board['stack'])
+				draw_piece(play_window, board['block'])
+				curses.doupdate()
+				board_changed = True
+				continue
+			elif c == ord('q'):
+				break
 
-	while True:
-		# positions after left/right movement or rotation
-		candidate_positions = None
-		# positions after falling down (by pressing down key or due to completed interval)
-		advanced_positions = None
-
-		# this method is non-blocking (set in setup_main_window)
-		c = stdscr.getch()
-
-		if c == curses.KEY_RIGHT:
-			candidate_positions = block.move_right()
-		elif c == curses.KEY_LEFT:
-			candidate_positions = block.move_left()
-		elif c == curses.KEY_DOWN:
-			advanced_positions = block.advance()
-		elif c == ord('a'):
-			candidate_positions = block.rotate_clockwise()
-		elif c == ord('d'):
-			candidate_positions = block.rotate_anti_clockwise()
-		elif c == ord('q'):
-			break
-
-		if time() - timer >= time_interval:
-			# interval is completed, setup next cycle
-			advanced_positions = block.advance()
-			timer = time()
-
-		if candidate_positions:
-			if validate_positions(candidate_positions, stack):
-				block.accept_move()
-				re_draw_piece(play_window, block)
-			else:
-				block.reject_move()
-
-		if advanced_positions:
-			if is_inside_stack(advanced_positions, stack):
-				affected_lines = increase_stack(block, stack)
-
-				if 1 in affected_lines:
-					# game over
-					end_animation(play_window)
-					break
-
-				cleared_lines = check_cleared_lines(stack, affected_lines)
+			interval_completed = time() - timer >= time_interval
+			if interval_completed:
+				# interval is completed, setup next cycle
+				timer = time()
 
+			block_positions = board['block'].current_positions
+			moved, cleared_lines, game_over = play_step(board, c, interval_completed)
+
+			if game_over:
+				end_animation(play_window)
+				break
+
+			if cleared_lines is not None:
+				# previous block was added to the stack and the next one was spawned
 				if cleared_lines:
 					clear_line_animation(play_window, cleared_lines)
-					clear_lines(cleared_lines, stack)
 					time_interval = score.send(len(cleared_lines))
 
-				block = next_piece()
-				stats.send(block)
-				next_piece = get_random_piece()
-				draw_next_piece(next_piece_window, next_piece)
+				stats.send(board['block'])
+				save_snapshot(history, board)
+				draw_next_piece(next_piece_window, board['next_piece'])
+				draw_stack(play_window, board['stack'])
 
-				draw_stack(play_window, stack)
-			else:
-				block.accept_move()
+			if moved:
+				if cleared_lines is not None:
+					# new block was spawned - previous one is already a part of the drawn stack
+					block_positions = None
 
-			re_draw_piece(play_window, block)
+				re_draw_piece(play_window, board['block'], block_positions)
+				# all windows touched in this cycle are updated at once
+				curses.doupdate()
+				board_changed = True
+	finally:
+		# dumps stats if profiling is still running (also when the game is interrupted)
+		profiler.close()
 
+		if shared_state is not None:
+			shared_state.close()
 
 """
 ===================Drawing functions===================
@@ -133,13 +159,13 @@ STATS_AREA_HEIGHT = 20
 STATS_PIECES = (T_Piece, J_Piece, Z_Piece, Square, S_Piece, L_Piece, LongBar)
 
 
-def setup_statistics(console_width):
+def setup_statistics(console_width, statistics_state):
 	statistics_window = curses.newwin(
 		STATS_AREA_HEIGHT + 2, 2 * STATS_AREA_WIDTH + 2, START_LINE, console_width // 2 - PLAY_AREA_WIDTH - 2 * STATS_AREA_WIDTH - 2
 	)
 	statistics_window.border()
 	statistics_window.addstr(1, 3, "STATISTICS")
-	statistics_window.refresh()
+	statistics_window.noutrefresh()
 
 	line = 2
 
@@ -155,31 +181,38 @@ def setup_statistics(console_width):
 		draw_piece(statistics_window, piece, x_offset)
 		line += 3
 
-	stats = statistics_gen(statistics_window)
+	stats = statistics_gen(statistics_window, statistics_state)
 	next(stats)
 
 	return stats
 
 
-def statistics_gen(window):
+def new_statistics_state():
+	# number of spawned blocks of every piece class
+	return defaultdict(int)
+
+
+def statistics_gen(window, stats):
 	"""
 	Corutine which maintains statistics and updates statistic window. Piece which shall be included in statistics is
-	expected to be send to this corutine.
+	expected to be send to this corutine. Counts are kept in the given dict (created by new_statistics_state), so they
+	can be saved and restored from outside - sending None re-draws restored counts.
 	"""
 	def re_draw_stats():
 		line = 2
 		for piece_class in STATS_PIECES:
-			piece_stats = stats[piece_class()]
+			piece_stats = stats[piece_class]
 			window.addstr(line, 10, f"{piece_stats:03}")
 			line += 3
 
-		window.refresh()
+		window.noutrefresh()
 
-	stats = defaultdict(int)
 	while True:
 		re_draw_stats()
 		piece = yield
-		stats[piece] += 1
+
+		if piece is not None:
+			stats[piece.__class__] += 1
 
 
 NEXT_PIECE_AREA_WIDTH = 4
@@ -192,7 +225,7 @@ def setup_next_piece_window(console_width):
 	)
 	next_piece_window.border()
 	next_piece_window.addstr(1, 3, "NEXT", curses.A_BOLD and curses.A_UNDERLINE)
-	next_piece_window.refresh()
+	next_piece_window.noutrefresh()
 
 	return next_piece_window
 
@@ -201,7 +234,7 @@ SCORE_AREA_WIDTH = 4
 SCORE_AREA_HEIGHT = 8
 
 
-def setup_score(console_width):
+def setup_score(console_width, score_state):
 	score_window = curses.newwin(
 		SCORE_AREA_HEIGHT + 2, 2 * SCORE_AREA_WIDTH + 2, START_LINE + 8, console_width // 2 + PLAY_AREA_WIDTH + 2
 	)
@@ -209,9 +242,9 @@ def setup_score(console_width):
 	score_window.addstr(1, 1, "SCORE:", curses.A_BOLD and curses.A_UNDERLINE)
 	score_window.addstr(4, 1, "LINES:", curses.A_BOLD and curses.A_UNDERLINE)
 	score_window.addstr(7, 1, "LEVEL:", curses.A_BOLD and curses.A_UNDERLINE)
-	score_window.refresh()
+	score_window.noutrefresh()
 
-	score = score_gen(score_window)
+	score = score_gen(score_window, score_state)
 	initial_time_interval = next(score)
 
 	return initial_time_interval, score
@@ -220,18 +253,30 @@ def setup_score(console_width):
 INITIAL_TIME_INTERVAL = 1
 
 
-def score_gen(window):
+def new_score_state():
+	return {
+		"score": 0,
+		"lines": 0,
+		"level": 0,
+		"time_interval": INITIAL_TIME_INTERVAL  # [s]
+	}
+
+
+def score_gen(window, state):
 	"""
 	Corutine which maintains score, level, number of cleared line and current time interval. Updated time interval is
-	returned as a response to sending cleared lines count.
+	returned as a response to sending cleared lines count. All values are kept in the given state dict (created by
+	new_score_state), so they can be saved and restored from outside - sending 0 re-draws restored values.
 	"""
 	def update_score_window():
-		window.addstr(2, 2, f"{score:05}")
-		window.addstr(5, 2, f"{lines:03}")
-		window.addstr(8, 2, f"{lvl:03}")
-		window.refresh()
+		window.addstr(2, 2, f"{state['score']:05}")
+		window.addstr(5, 2, f"{state['lines']:03}")
+		window.addstr(8, 2, f"{state['level']:03}")
+		window.noutrefresh()
 
 	def calculate_score(lines_cnt):
+		lvl = state['level']
+
 		# scoring system taken from https://tetris.fandom.com/wiki/Scoring
 		if lines_cnt == 4:
 			# Tetris
@@ -244,30 +289,27 @@ def score_gen(window):
 		return 40 * (lvl + 1)
 
 	def update_time_interval():
-		offset = lvl * 0.1
+		offset = state['level'] * 0.1
 		if INITIAL_TIME_INTERVAL > offset:
 			return INITIAL_TIME_INTERVAL - offset
 
-		return current_time_interval
-
-	current_time_interval = INITIAL_TIME_INTERVAL  # [s]
-	score = 0
-	lines = 0
-	lvl = 0
+		return state['time_interval']
 
 	while True:
 		update_score_window()
-		nbr_of_cleared_lines = yield current_time_interval
-		lines += nbr_of_cleared_lines
-		score += calculate_score(nbr_of_cleared_lines)
-		lvl = lines // 10
-		current_time_interval = update_time_interval()
+		nbr_of_cleared_lines = yield state['time_interval']
+
+		if nbr_of_cleared_lines:
+			state['lines'] += nbr_of_cleared_lines
+			state['score'] += calculate_score(nbr_of_cleared_lines)
+			state['level'] = state['lines'] // 10
+			state['time_interval'] = update_time_interval()
 
 
 HELP_AREA_HEIGHT = 3
 
 
-def setup_help(console_width):
+def setup_help(console_width, practice=False):
 	help_window = curses.newwin(
 		HELP_AREA_HEIGHT + 2, 2 * STATS_AREA_WIDTH + 2 + 2 * PLAY_AREA_WIDTH + 2 + 2 * SCORE_AREA_WIDTH + 2,
 		START_LINE + STATS_AREA_HEIGHT + 2, console_width // 2 - PLAY_AREA_WIDTH - 2 * STATS_AREA_WIDTH - 2
@@ -276,8 +318,11 @@ def setup_help(console_width):
 	help_window.border()
 	help_window.addstr(1, 4, "LEFT/RIGHT/DOWN arrow keys to move piece", curses.A_BOLD)
 	help_window.addstr(2, 1, "A - rotate clockwise, D - rotate anticlockwise", curses.A_BOLD)
-	help_window.addstr(3, 20, "Q - Quit", curses.A_BOLD)
-	help_window.refresh()
+	if practice:
+		help_window.addstr(3, 4, "U - undo, P - toggle profiler, Q - Quit", curses.A_BOLD)
+	else:
+		help_window.addstr(3, 9, "P - toggle profiler, Q - Quit", curses.A_BOLD)
+	help_window.noutrefresh()
 
 
 # associated given piece with color pairs defined in init_colors
@@ -305,9 +350,11 @@ def init_colors():
 	curses.init_pair(7, curses.COLOR_WHITE, curses.COLOR_BLACK)
 
 
-def re_draw_piece(window, piece: AbstractPiece):
-	previous_positions = piece.previous_positions
-
+def re_draw_piece(window, piece: AbstractPiece, previous_positions):
+	"""
+	:param previous_positions: positions of the piece when it was drawn last time (None for a new piece); piece can be
+	moved more than once in a single cycle, so piece.previous_positions is not enough
+	"""
 	if previous_positions:
 		for old_y, old_x in previous_positions:
 			window.addch(old_y, 2 * old_x + 1, " ")
@@ -325,7 +372,7 @@ def draw_piece(window, piece, x_offset=1):
 		window.addch(new_y, 2 * new_x + x_offset, "[", curses.color_pair(color))
 		window.addch(new_y, 2 * new_x + x_offset + 1, "]", curses.color_pair(color))
 
-	window.refresh()
+	window.noutrefresh()
 
 
 def draw_next_piece(window, piece_class):
@@ -360,7 +407,7 @@ def draw_stack(window, stack):
 		window.addch(y, 2 * x + 1, "[", curses.color_pair(color))
 		window.addch(y, 2 * x + 2, "]", curses.color_pair(color))
 
-	window.refresh()
+	window.noutrefresh()
 
 
 def clear_line_animation(window, lines):
@@ -406,6 +453,94 @@ def end_animation(window):
 """
 
 
+def new_board(pieces=None):
+	"""
+	:param pieces: iterator of piece classes (e.g. randomizer_gen); uniformly random pieces are used if not given
+	"""
+	if pieces is None:
+		pieces = randomizer_gen()
+
+	return {
+		"stack": {
+			"positions": dict(),
+			"previous_positions": None
+		},
+		"pieces": pieces,
+		"score": new_score_state(),
+		"statistics": new_statistics_state(),
+		"block": next(pieces)(),
+		"next_piece": next(pieces)
+	}
+
+
+def play_step(board, key, interval_completed=False):
+	"""
+	Executes single cycle of game logic on the given board - handles pressed key and falling of the current block.
+	Nothing is drawn here, so the same logic drives both interactive and headless boards.
+	:param board: board created by new_board; updated in place
+	:param key: key code as returned by getch (-1 when no key was pressed)
+	:param interval_completed: if True current block falls down by one line
+	:return: tuple (moved, cleared_lines, game_over); moved is True when current block needs to be re-drawn,
+	cleared_lines is None while current block is falling, otherwise current block was added to the stack, next one was
+	spawned and list of cleared lines (possibly empty) is returned
+	"""
+	block = board['block']
+	stack = board['stack']
+
+	# positions after left/right movement or rotation
+	candidate_positions = None
+	# positions after falling down (by pressing down key or due to completed interval)
+	advanced_positions = None
+
+	moved = False
+
+	if key == curses.KEY_RIGHT:
+		candidate_positions = block.move_right()
+	elif key == curses.KEY_LEFT:
+		candidate_positions = block.move_left()
+	elif key == ord('a'):
+		candidate_positions = block.rotate_clockwise()
+	elif key == ord('d'):
+		candidate_positions = block.rotate_anti_clockwise()
+
+	if candidate_positions:
+		if validate_positions(candidate_positions, stack):
+			block.accept_move()
+			moved = True
+		else:
+			block.reject_move()
+
+	# falling needs to be calculated after the move is accepted or rejected - advance overrides the requested move
+	if key == curses.KEY_DOWN or interval_completed:
+		advanced_positions = block.advance()
+
+	if advanced_positions:
+		if is_inside_stack(advanced_positions, stack):
+			affected_lines = increase_stack(block, stack)
+
+			if 1 in affected_lines:
+				return moved, None, True
+
+			cleared_lines = check_cleared_lines(stack, affected_lines)
+
+			if cleared_lines:
+				clear_lines(cleared_lines, stack)
+
+			board['block'] = board['next_piece']()
+			board['next_piece'] = next(board['pieces'])
+
+			if not validate_positions(board['block'].current_positions, stack):
+				# no room for the next block
+				return True, cleared_lines, True
+
+			return True, cleared_lines, False
+
+		block.accept_move()
+		moved = True
+
+	return moved, None, False
+
+
 def validate_positions(requested_positions, stack):
 	for candidate_y, candidate_x in requested_positions:
 		if candidate_y <= 0 or candidate_y > PLAY_AREA_HEIGHT:
@@ -494,5 +629,102 @@ def clear_lines(lines, stack):
 	stack['positions'] = new_positions
 
 
+"""
+===================History functions===================
+"""
+
+# Snapshot of the board is saved every time a new block is spawned. Snapshots are immutable - stack is kept as a tuple
+# of rows (tuples of colors, None for empty cells) and rows which don't change between snapshots (also rows which were
+# only moved down by cleared lines) are shared instead of being copied, so every snapshot costs only the rows it
+# changed.
+
+HISTORY_SIZE = 100
+
+Snapshot = namedtuple("Snapshot", ["rows", "block_class", "next_piece", "score", "statistics"])
+
+EMPTY_ROW = (None,) * PLAY_AREA_WIDTH
+
+
+def new_history(size=HISTORY_SIZE):
+	# ring buffer - appending to the full deque drops the oldest snapshot
+	return deque(maxlen=size)
+
+
+def save_snapshot(history, board):
+	"""
+	Saves snapshot of the board; shall be called when new block has been just spawned (and counted in statistics).
+	"""
+	positions = board['stack']['positions']
+
+	# rows of the previous snapshot (by content) which can be shared by the new one
+	known_rows = {EMPTY_ROW: EMPTY_ROW}
+	if history:
+		known_rows.update((row, row) for row in history[-1].rows)
+
+	rows = list()
+
+	for line in range(1, PLAY_AREA_HEIGHT + 1):
+		row = tuple(positions.get((line, x)) for x in range(PLAY_AREA_WIDTH))
+		rows.append(known_rows.setdefault(row, row))
+
+	history.append(Snapshot(
+		rows=tuple(rows),
+		block_class=board['block'].__class__,
+		next_piece=board['next_piece'],
+		score=tuple(board['score'].items()),
+		statistics=tuple(board['statistics'].items())
+	))
+
+
+def rewind(history, board):
+	"""
+	Restores the board to the state from the spawn of the previous block (or the spawn of the current block if there is
+	no previous snapshot). Snapshots newer than restored one are dropped, so restoring doesn't depend on the history
+	length. Pieces following the restored next piece are still taken from the board randomizer, so they may differ from
+	the rewound ones.
+	:return: False if there is nothing to restore
+	"""
+	if not history:
+		return False
+
+	if len(history) > 1:
+		# snapshot of the current block
+		history.pop()
+
+	snapshot = history[-1]
+	stack = board['stack']
+	positions = dict()
+
+	for line, row in enumerate(snapshot.rows, start=1):
+		if row is EMPTY_ROW:
+			continue
+
+		for x, color in enumerate(row):
+			if color is not None:
+				positions[(line, x)] = color
+
+	# previous positions need to be erased from the window
+	stack['previous_positions'] = stack['positions']
+	stack['positions'] = positions
+
+	board['block'] = snapshot.block_class()
+	board['next_piece'] = snapshot.next_piece
+	board['score'].update(snapshot.score)
+	# pieces spawned after the snapshot are not counted any more
+	board['statistics'].clear()
+	board['statistics'].update(snapshot.statistics)
+
+	return True
+
+
 if __name__ == '__main__':
-	curses.wrapper(main)
+	parser = argparse.ArgumentParser(description="NES-like Tetris game playable in terminal.")
+	parser.add_argument("--randomizer", choices=RANDOMIZERS, default=DEFAULT_RANDOMIZER, help="order of pieces")
+	parser.add_argument("--seed", type=int, help="seed of the randomizer")
+	parser.add_argument("--practice", action="store_true", help="practice mode - placed pieces can be undone")
+	parser.add_argument(
+		"--shared-state", metavar="NAME", help="publish state of the game in shared memory block for bots and observers"
+	)
+	args = parser.parse_args()
+
+	curses.wrapper(main, args.randomizer, args.seed, args.practice, args.shared_state)
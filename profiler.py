@@ -0,0 +1,59 @@
+"""
+On-demand profiling of the live game loop.
+"""
+import cProfile
+import os
+from time import strftime
+
+# when set (to any non-empty value) profiling starts together with the game
+PROFILE_ENV_VARIABLE = "TETRIS_PROFILE"
+# process id and number of the dump keep names unique when profiling is stopped more than once per second
+PROFILE_FILE_PATTERN = "tetris-%Y%m%d-%H%M%S-{pid}-{dump}.prof"
+
+
+def setup_profiler():
+	profiler = profiler_gen(start_enabled=bool(os.environ.get(PROFILE_ENV_VARIABLE)))
+	next(profiler)
+
+	return profiler
+
+
+def profiler_gen(start_enabled=False):
+	"""
+	Corutine which toggles cProfile around the game loop. Each value sent to this corutine toggles the profiler; current
+	state (True when profiling) is returned as a response. Every time profiling is stopped - either by toggling or by
+	closing this corutine - collected stats are dumped to a new pstats file in the current working directory.
+	"""
+	def dump_stats():
+		nonlocal dumps_cnt
+		dumps_cnt += 1
+		file_name = strftime(PROFILE_FILE_PATTERN).format(pid=os.getpid(), dump=dumps_cnt)
+		profile.dump_stats(file_name)
+
+		return file_name
+
+	profile = cProfile.Profile()
+	enabled = False
+	dumps_cnt = 0
+
+	if start_enabled:
+		profile.enable()
+		enabled = True
+
+	try:
+		while True:
+			yield enabled
+
+			if enabled:
+				profile.disable()
+				dump_stats()
+				# next session shall not contain stats from the previous one
+				profile = cProfile.Profile()
+			else:
+				profile.enable()
+
+			enabled = not enabled
+	finally:
+		if enabled:
+			profile.disable()
+			dump_stats()
@@ -0,0 +1,148 @@
+"""
+Randomizers which decide about the order of pieces.
+
+Pieces are generated in chunks - arrays of indexes into all_pieces (NumPy arrays when NumPy is available, array.array
+otherwise). Streaming pieces one by one (as the game does) and generating long sequences at once gives exactly the same
+pieces for the same randomizer and seed. Sequences are reproducible only within the same backend (NumPy or pure
+Python) though.
+"""
+from array import array
+import random
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from pieces import all_pieces
+
+PIECES_CNT = len(all_pieces)
+# multiple of bag size, so no bag is split between chunks
+CHUNK_SIZE = PIECES_CNT * 8192
+# previous piece assumed before the first piece is generated; it never equals any real piece
+NO_PIECE = PIECES_CNT
+
+
+def uniform_chunk(rng, size, previous):
+	"""Every piece is chosen independently with the same probability."""
+	if np is not None:
+		return rng.integers(0, PIECES_CNT, size, dtype=np.uint8)
+
+	return array('B', rng.choices(range(PIECES_CNT), k=size))
+
+
+def bag_chunk(rng, size, previous):
+	"""Every piece occurs exactly once in each following group (bag) of seven pieces."""
+	bags_cnt = size // PIECES_CNT
+
+	if np is not None:
+		# order of random keys is a random permutation of pieces in each bag
+		return rng.random((bags_cnt, PIECES_CNT)).argsort(axis=1).astype(np.uint8).ravel()
+
+	chunk = array('B')
+	bag = list(range(PIECES_CNT))
+
+	for _ in range(bags_cnt):
+		rng.shuffle(bag)
+		chunk.extend(bag)
+
+	return chunk
+
+
+def nes_chunk(rng, size, previous):
+	"""
+	NES-like randomizer: one of eight values is rolled; if it is the extra value or the same piece as the previous one,
+	a second roll among seven pieces is made (without checking it any more).
+	"""
+	if np is not None:
+		first_rolls = rng.integers(0, PIECES_CNT + 1, size, dtype=np.uint8)
+		second_rolls = rng.integers(0, PIECES_CNT, size, dtype=np.uint8)
+		rerolled = first_rolls == NO_PIECE
+		chunk = np.where(rerolled, second_rolls, first_rolls)
+
+		# every piece depends on the previous one - repeat until all dependencies are resolved; pieces coming from
+		# extra value rolls don't depend on anything, so chains of dependencies are short
+		while True:
+			previous_pieces = np.concatenate(([previous], chunk[:-1]))
+			resolved_chunk = np.where(rerolled | (first_rolls == previous_pieces), second_rolls, first_rolls)
+
+			if np.array_equal(resolved_chunk, chunk):
+				return chunk
+
+			chunk = resolved_chunk
+
+	chunk = array('B')
+
+	for _ in range(size):
+		piece = rng.randrange(PIECES_CNT + 1)
+
+		if piece == NO_PIECE or piece == previous:
+			piece = rng.randrange(PIECES_CNT)
+
+		chunk.append(piece)
+		previous = piece
+
+	return chunk
+
+
+RANDOMIZERS = {
+	"uniform": uniform_chunk,
+	"bag": bag_chunk,
+	"nes": nes_chunk,
+}
+DEFAULT_RANDOMIZER = "uniform"
+
+
+def sequence_gen(randomizer=DEFAULT_RANDOMIZER, seed=None, chunk_size=CHUNK_SIZE):
+	"""
+	Generator of chunks of pieces indexes.
+	:param randomizer: name of the randomizer (key of RANDOMIZERS)
+	:param seed: seed of the random generator; random sequence is generated if not given
+	:param chunk_size: number of pieces in each chunk (must be multiple of 7)
+	"""
+	generate_chunk = RANDOMIZERS[randomizer]
+
+	if np is not None:
+		rng = np.random.default_rng(seed)
+	else:
+		rng = random.Random(seed)
+
+	previous = NO_PIECE
+
+	while True:
+		chunk = generate_chunk(rng, chunk_size, previous)
+		previous = chunk[-1]
+		yield chunk
+
+
+def generate_sequence(count, randomizer=DEFAULT_RANDOMIZER, seed=None):
+	"""
+	Generates sequence of count pieces indexes (into all_pieces) at once.
+	"""
+	chunks = list()
+	generated_cnt = 0
+
+	for chunk in sequence_gen(randomizer, seed):
+		if generated_cnt >= count:
+			break
+
+		chunks.append(chunk)
+		generated_cnt += len(chunk)
+
+	if np is not None:
+		return np.concatenate(chunks or [np.empty(0, dtype=np.uint8)])[:count]
+
+	sequence = array('B')
+	for chunk in chunks:
+		sequence.extend(chunk)
+
+	return sequence[:count]
+
+
+def randomizer_gen(randomizer=DEFAULT_RANDOMIZER, seed=None):
+	"""
+	Generator of piece classes in the order decided by given randomizer.
+	"""
+	for chunk in sequence_gen(randomizer, seed):
+		for piece_index in chunk.tolist():
+			yield all_pieces[piece_index]
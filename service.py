@@ -0,0 +1,213 @@
+"""
+Streaming position evaluation service.
+
+Every input line describes one position:
+
+    <stack> <current piece> [<next piece>]
+
+where stack is encoded row by row (from the top line of the play area) with 3 hex digits per row - the most significant
+of 10 used bits is the leftmost column - and pieces are given by their letters (see PIECE_NAMES). For every position a
+line with the evaluation of the best placement followed by keys (in replay file format, see wall.py) leading the current
+piece to it is returned; the piece shall be moved down afterwards. If every placement ends the game "none" is returned;
+invalid lines are answered with "error: <description>". Python clients can encode the stack with encode_stack.
+
+Positions are evaluated concurrently by a pool of worker processes, answers are streamed back in the order of positions.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import socketserver
+import sys
+import threading
+
+from bot import best_placement
+from game import PLAY_AREA_HEIGHT, PLAY_AREA_WIDTH
+from pieces import *
+from wall import REPLAY_KEYS
+
+PIECE_NAMES = {
+	"O": Square,
+	"I": LongBar,
+	"L": L_Piece,
+	"J": J_Piece,
+	"Z": Z_Piece,
+	"S": S_Piece,
+	"T": T_Piece,
+}
+KEY_NAMES = {key: name for name, key in REPLAY_KEYS.items()}
+
+ROW_DIGITS = 3
+# number of positions read ahead of the last written answer; reading stops when the limit is reached
+MAX_PENDING_POSITIONS = 256
+# [s] how often the blocked reader checks whether answers are still being written
+READER_STOP_CHECK_INTERVAL = 0.1
+
+
+def main(socket_path=None, workers=None):
+	"""
+	Evaluates positions from standard input or, when socket_path is given, from every connection of the local socket.
+	:param workers: number of worker processes; number of CPUs if not given
+	"""
+	with multiprocessing.Pool(workers) as pool:
+		if socket_path is None:
+			# undecodable lines are answered with an error instead of ending the stream
+			sys.stdin.reconfigure(errors="replace")
+			serve_stream(sys.stdin, sys.stdout, pool)
+			return
+
+		if os.path.exists(socket_path):
+			# left by the previous instance which has been killed
+			os.unlink(socket_path)
+
+		server = socketserver.ThreadingUnixStreamServer(socket_path, StreamHandler)
+		# connections are served by threads which share the pool of workers
+		server.pool = pool
+		server.daemon_threads = True
+
+		try:
+			server.serve_forever()
+		finally:
+			server.server_close()
+			os.unlink(socket_path)
+
+
+class StreamHandler(socketserver.StreamRequestHandler):
+	def handle(self):
+		# undecodable lines are answered with an error instead of ending the connection
+		input_lines = (line.decode(errors="replace") for line in self.rfile)
+
+		try:
+			serve_stream(input_lines, self, self.server.pool)
+		except (BrokenPipeError, ConnectionResetError):
+			# client has disconnected - there is nobody to answer
+			pass
+
+	def write(self, text):
+		self.wfile.write(text.encode())
+
+	def flush(self):
+		self.wfile.flush()
+
+
+def serve_stream(input_lines, output, pool):
+	"""
+	Every position is sent to workers as soon as it is read (by a separate thread, so answers are written even while
+	waiting for the next position) and answers are written in the order of positions. Serving ends when the input ends
+	(or fails) and reading stops when writing of answers fails.
+	"""
+	pending_answers = queue.Queue(MAX_PENDING_POSITIONS)
+	writing_stopped = threading.Event()
+
+	def put(item):
+		# blocks when too many answers are waiting to be written, unless nobody writes them any more
+		while not writing_stopped.is_set():
+			try:
+				pending_answers.put(item, timeout=READER_STOP_CHECK_INTERVAL)
+				return True
+			except queue.Full:
+				pass
+
+		return False
+
+	def read_positions():
+		try:
+			for line in input_lines:
+				if not put(pool.apply_async(evaluate_line, (line,))):
+					return
+		finally:
+			# end of answers is marked also when reading fails
+			put(None)
+
+	threading.Thread(target=read_positions, daemon=True).start()
+
+	try:
+		while True:
+			answer = pending_answers.get()
+
+			if answer is None:
+				break
+
+			output.write(answer.get() + "\n")
+			output.flush()
+	finally:
+		writing_stopped.set()
+
+
+def evaluate_line(line):
+	try:
+		stack, piece_class, next_piece_class = decode_position(line)
+	except ValueError as error:
+		return f"error: {error}"
+
+	keys, evaluation = best_placement(stack, piece_class, next_piece_class)
+
+	if evaluation is None:
+		return "none"
+
+	return " ".join([f"{evaluation:.6f}"] + [KEY_NAMES[key] for key in keys])
+
+
+def decode_position(line):
+	fields = line.split()
+
+	if len(fields) not in (2, 3):
+		raise ValueError("expected stack, current piece and optional next piece")
+
+	encoded_stack, *piece_names = fields
+
+	for piece_name in piece_names:
+		if piece_name not in PIECE_NAMES:
+			raise ValueError(f"unknown piece {piece_name}")
+
+	piece_class = PIECE_NAMES[piece_names[0]]
+	next_piece_class = PIECE_NAMES[piece_names[1]] if len(piece_names) == 2 else None
+
+	return decode_stack(encoded_stack), piece_class, next_piece_class
+
+
+def decode_stack(encoded_stack):
+	if len(encoded_stack) != PLAY_AREA_HEIGHT * ROW_DIGITS:
+		raise ValueError(f"expected {PLAY_AREA_HEIGHT * ROW_DIGITS} hex digits of stack")
+
+	positions = dict()
+
+	for line in range(1, PLAY_AREA_HEIGHT + 1):
+		# raises ValueError for non-hex digits
+		row = int(encoded_stack[(line - 1) * ROW_DIGITS:line * ROW_DIGITS], 16)
+
+		for x in range(PLAY_AREA_WIDTH):
+			if row & (1 << (PLAY_AREA_WIDTH - 1 - x)):
+				positions[(line, x)] = 0
+
+	return {
+		"positions": positions,
+		"previous_positions": None
+	}
+
+
+def encode_stack(stack):
+	"""
+	Encodes stack of a board (e.g. the one played by a Python client) into the stack field of the input line.
+	"""
+	encoded_stack = ""
+
+	for line in range(1, PLAY_AREA_HEIGHT + 1):
+		row = 0
+
+		for x in range(PLAY_AREA_WIDTH):
+			if (line, x) in stack['positions']:
+				row |= 1 << (PLAY_AREA_WIDTH - 1 - x)
+
+		encoded_stack += f"{row:0{ROW_DIGITS}x}"
+
+	return encoded_stack
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Streams evaluations of Tetris positions read line by line.")
+	parser.add_argument("--socket", help="path of the local socket to listen on (default: read standard input)")
+	parser.add_argument("-j", "--workers", type=int, help="number of worker processes (default: number of CPUs)")
+	args = parser.parse_args()
+
+	main(args.socket, args.workers)
@@ -0,0 +1,222 @@
+"""
+Shared memory interface for external bots and observers.
+
+Running game publishes its state into a shared memory block with fixed layout (little endian, offsets in bytes):
+
+    0   magic b"TETR", layout version (uint32)
+    8   sequence counter (uint64) - odd while the state is being written
+    16  state: frame (uint64), piece (int8), orientation (int8), rotation block y, x (int16), next piece (int8),
+        padding, score, lines, level (uint32), stack rows (20 x uint16; the top row first, bit 9 is the leftmost column)
+    84  input ring buffer: write index (uint32, written by bots), read index (uint32, written by the game)
+    92  input ring buffer: 256 key codes (int32)
+
+Pieces are indexes into all_pieces, orientation is index of the orientation in the piece orientations; frame 0 means
+that the state hasn't been published yet. Readers get consistent state without locks by re-reading it until the
+sequence counter is even and the same before and after reading (see read_state). Keys written into the input ring
+buffer (see send_key) are played by the game one per frame (only in frames without a key pressed in the terminal);
+keys which haven't been played yet stay in the buffer, so bots can't get ahead of the game by more than its size. Only
+gameplay keys (see BOT_KEYS) are played, other keys (e.g. quitting the game) are ignored.
+"""
+import curses
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+from pieces import all_pieces
+
+MAGIC = b"TETR"
+LAYOUT_VERSION = 1
+# size of the stack is fixed by the layout (the same as the play area)
+STACK_ROWS = 20
+STACK_COLUMNS = 10
+
+HEADER = struct.Struct("<4sI")
+SEQUENCE = struct.Struct("<Q")
+FRAME = struct.Struct("<Q")
+STATE = struct.Struct(f"<QbbhhbxIII{STACK_ROWS}H")
+INPUT_INDEXES = struct.Struct("<II")
+INPUT_KEY = struct.Struct("<i")
+INPUT_RING_SIZE = 256
+
+SEQUENCE_OFFSET = HEADER.size
+STATE_OFFSET = SEQUENCE_OFFSET + SEQUENCE.size
+INPUT_INDEXES_OFFSET = STATE_OFFSET + STATE.size
+INPUT_RING_OFFSET = INPUT_INDEXES_OFFSET + INPUT_INDEXES.size
+SHARED_STATE_SIZE = INPUT_RING_OFFSET + INPUT_RING_SIZE * INPUT_KEY.size
+
+# indexes of the input ring buffer wrap around
+INDEX_MODULO = 2 ** 32
+
+# keys which can be played by bots - the same as in replay files (see wall.REPLAY_KEYS)
+BOT_KEYS = frozenset((curses.KEY_LEFT, curses.KEY_RIGHT, curses.KEY_DOWN, ord('a'), ord('d'), -1))
+
+DEFAULT_SHARED_STATE_NAME = "tetris"
+
+
+def setup_shared_state(name=DEFAULT_SHARED_STATE_NAME):
+	shared_state = shared_state_gen(name)
+	next(shared_state)
+
+	return shared_state
+
+
+def shared_state_gen(name):
+	"""
+	Corutine which publishes state of the board in the shared memory block of given name. Tuple (board, read_key) is
+	expected to be sent to this corutine every frame (board can be None when it hasn't changed - only the frame counter
+	is updated then). If read_key is True, the oldest key sent by bots is taken from the input ring buffer and returned
+	as a response; -1 is returned when there is no such key or it wasn't requested (as curses getch does). Shared memory
+	block is removed when this corutine is closed.
+	"""
+	memory = shared_memory.SharedMemory(name=name, create=True, size=SHARED_STATE_SIZE)
+	buffer = memory.buf
+	HEADER.pack_into(buffer, 0, MAGIC, LAYOUT_VERSION)
+	SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, 0)
+	INPUT_INDEXES.pack_into(buffer, INPUT_INDEXES_OFFSET, 0, 0)
+
+	sequence = 0
+	frame = 0
+	key = -1
+
+	try:
+		while True:
+			board, read_key = yield key
+			frame += 1
+
+			# odd sequence tells readers that the state is being written
+			sequence += 1
+			SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, sequence)
+
+			if board is None:
+				FRAME.pack_into(buffer, STATE_OFFSET, frame)
+			else:
+				STATE.pack_into(buffer, STATE_OFFSET, frame, *encode_board(board))
+
+			sequence += 1
+			SEQUENCE.pack_into(buffer, SEQUENCE_OFFSET, sequence)
+
+			key = read_input(buffer) if read_key else -1
+	finally:
+		del buffer
+		memory.close()
+		memory.unlink()
+
+
+def encode_board(board):
+	block = board['block']
+	orientations = list(type(block.orientation))
+	rotation_y, rotation_x = block.rotation_block
+	score = board['score']
+
+	return (
+		all_pieces.index(type(block)),
+		orientations.index(block.orientation),
+		rotation_y,
+		rotation_x,
+		all_pieces.index(board['next_piece']),
+		score['score'],
+		score['lines'],
+		score['level'],
+		*encode_rows(board['stack'])
+	)
+
+
+def encode_rows(stack):
+	rows = [0] * STACK_ROWS
+
+	for y, x in stack['positions']:
+		rows[y - 1] |= 1 << (STACK_COLUMNS - 1 - x)
+
+	return rows
+
+
+def read_input(buffer):
+	write_index, read_index = INPUT_INDEXES.unpack_from(buffer, INPUT_INDEXES_OFFSET)
+
+	if read_index == write_index:
+		return -1
+
+	slot = read_index % INPUT_RING_SIZE
+	key, = INPUT_KEY.unpack_from(buffer, INPUT_RING_OFFSET + slot * INPUT_KEY.size)
+	# only the read index is owned by the game; the slot can be reused by bots after it is updated
+	struct.pack_into("<I", buffer, INPUT_INDEXES_OFFSET + 4, (read_index + 1) % INDEX_MODULO)
+
+	if key not in BOT_KEYS:
+		# bots can't quit the game, undo or control the profiler
+		return -1
+
+	return key
+
+
+"""
+===================Bots and observers functions===================
+"""
+
+
+def attach_shared_state(name=DEFAULT_SHARED_STATE_NAME):
+	# observers don't own the block - it mustn't be removed when they exit
+	try:
+		memory = shared_memory.SharedMemory(name=name, track=False)
+	except TypeError:
+		# before Python 3.13 every attached block is tracked
+		memory = shared_memory.SharedMemory(name=name)
+		resource_tracker.unregister(memory._name, "shared_memory")
+
+	magic, version = HEADER.unpack_from(memory.buf, 0)
+
+	if magic != MAGIC or version != LAYOUT_VERSION:
+		memory.close()
+		raise ValueError(f"{name} is not a shared state of Tetris game (layout version {LAYOUT_VERSION})")
+
+	return memory
+
+
+def read_state(memory):
+	"""
+	Reads consistent state of the game from the attached shared memory block.
+	"""
+	buffer = memory.buf
+
+	while True:
+		sequence, = SEQUENCE.unpack_from(buffer, SEQUENCE_OFFSET)
+
+		if sequence % 2:
+			# state is being written
+			continue
+
+		values = STATE.unpack_from(buffer, STATE_OFFSET)
+
+		if SEQUENCE.unpack_from(buffer, SEQUENCE_OFFSET)[0] == sequence:
+			break
+
+	frame, piece, orientation, rotation_y, rotation_x, next_piece, score, lines, level, *rows = values
+
+	return {
+		"frame": frame,
+		"piece": piece,
+		"orientation": orientation,
+		"rotation_block": (rotation_y, rotation_x),
+		"next_piece": next_piece,
+		"score": score,
+		"lines": lines,
+		"level": level,
+		"rows": rows
+	}
+
+
+def send_key(memory, key):
+	"""
+	Puts key code into the input ring buffer of the game; keys which are not in BOT_KEYS are ignored by the game.
+	:return: False if the buffer is full
+	"""
+	buffer = memory.buf
+	write_index, read_index = INPUT_INDEXES.unpack_from(buffer, INPUT_INDEXES_OFFSET)
+
+	if (write_index - read_index) % INDEX_MODULO >= INPUT_RING_SIZE:
+		return False
+
+	slot = write_index % INPUT_RING_SIZE
+	INPUT_KEY.pack_into(buffer, INPUT_RING_OFFSET + slot * INPUT_KEY.size, key)
+	# key is visible for the game only after the write index is updated
+	struct.pack_into("<I", buffer, INPUT_INDEXES_OFFSET, (write_index + 1) % INDEX_MODULO)
+
+	return True
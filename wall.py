@@ -0,0 +1,213 @@
+"""
+Wall mode - many boards, each driven by a bot or a replay, rendered in a single terminal.
+
+All boards share one render scheduler: every board only marks its windows for update (noutrefresh) and the whole
+terminal is updated with a single curses.doupdate per frame.
+"""
+import argparse
+import curses
+from functools import partial
+from time import time, sleep
+
+from bot import bot_driver
+from game import PLAY_AREA_HEIGHT, PLAY_AREA_WIDTH, new_board, play_step, draw_piece, re_draw_piece, draw_stack, \
+	init_colors
+from randomizers import RANDOMIZERS, DEFAULT_RANDOMIZER, randomizer_gen
+
+FRAMES_PER_SECOND = 30
+
+BOARD_HEIGHT = PLAY_AREA_HEIGHT + 2
+# one additional column separates neighbouring boards
+BOARD_WIDTH = 2 * PLAY_AREA_WIDTH + 2 + 1
+# first line of the terminal is reserved for the title
+TOP_LINE = 1
+
+# names of keys used in replay files
+REPLAY_KEYS = {
+	"left": curses.KEY_LEFT,
+	"right": curses.KEY_RIGHT,
+	"down": curses.KEY_DOWN,
+	"a": ord('a'),
+	"d": ord('d'),
+	# no key pressed in given frame
+	"-": -1,
+}
+# key name followed by this suffix means that the gravity interval was completed in the same frame
+REPLAY_TICK_SUFFIX = "+"
+KEY_NAMES = {key: name for name, key in REPLAY_KEYS.items()}
+
+
+def main(stdscr, boards_cnt=None, replays=(), fps=FRAMES_PER_SECOND, randomizer=DEFAULT_RANDOMIZER, seed=None):
+	"""
+	Main function of the wall mode.
+	:param stdscr: standard curses screen; will be supplied by wrapper function
+	:param boards_cnt: number of boards; as many boards as fit in the terminal when not given
+	:param replays: paths of replay files; first boards are driven by replays, remaining ones by bots
+	:param fps: number of frames per second
+	:param randomizer: name of the randomizer used by all boards
+	:param seed: seed of the randomizer used by the first board (following boards use following seeds); every game on
+	given board starts with the same seed, so replays can be repeated; random if not given
+	"""
+	setup_wall_window(stdscr)
+	height, width = stdscr.getmaxyx()
+
+	rows = max((height - TOP_LINE) // BOARD_HEIGHT, 1)
+	columns = max(width // BOARD_WIDTH, 1)
+
+	if boards_cnt is None:
+		boards_cnt = rows * columns
+
+	boards_cnt = min(boards_cnt, rows * columns)
+	# boards are centered horizontally
+	left_margin = (width - min(boards_cnt, columns) * BOARD_WIDTH) // 2
+
+	slots = list()
+
+	for index in range(boards_cnt):
+		row, column = divmod(index, columns)
+		window = curses.newwin(
+			BOARD_HEIGHT, BOARD_WIDTH - 1, TOP_LINE + row * BOARD_HEIGHT, left_margin + column * BOARD_WIDTH
+		)
+
+		if index < len(replays):
+			driver_factory = partial(replay_driver, replays[index])
+		else:
+			driver_factory = bot_steps_driver
+
+		slot = {
+			"number": index + 1,
+			"window": window,
+			"driver_factory": driver_factory,
+			"randomizer": randomizer,
+			"seed": None if seed is None else seed + index,
+			"lines": 0,
+			"games": 0
+		}
+		start_game(slot)
+		slots.append(slot)
+
+	curses.doupdate()
+
+	frame_time = 1 / fps
+
+	while True:
+		frame_start = time()
+
+		# this method is non-blocking (set in setup_wall_window)
+		if stdscr.getch() == ord('q'):
+			break
+
+		for slot in slots:
+			update_slot(slot)
+
+		# the only place where terminal is actually updated
+		curses.doupdate()
+
+		sleep(max(frame_time - (time() - frame_start), 0))
+
+
+def start_game(slot):
+	board = new_board(randomizer_gen(slot['randomizer'], slot['seed']))
+
+	slot['board'] = board
+	# driver works on the board directly - it needs to be created for every new game
+	slot['driver'] = slot['driver_factory'](board)
+	slot['games'] += 1
+
+	window = slot['window']
+	window.erase()
+	window.border()
+	draw_label(slot)
+	draw_piece(window, board['block'])
+
+
+def update_slot(slot):
+	board = slot['board']
+	window = slot['window']
+
+	# idle when driver is exhausted (e.g. replay has ended)
+	key, interval_completed = next(slot['driver'], (-1, False))
+	block_positions = board['block'].current_positions
+	moved, cleared_lines, game_over = play_step(board, key, interval_completed)
+
+	if game_over:
+		start_game(slot)
+		return
+
+	if cleared_lines is not None:
+		slot['lines'] += len(cleared_lines)
+		draw_stack(window, board['stack'])
+		draw_label(slot)
+		# new block was spawned - previous one is already a part of the drawn stack
+		block_positions = None
+
+	if moved:
+		re_draw_piece(window, board['block'], block_positions)
+
+
+def draw_label(slot):
+	label = f"{slot['number']}: G{slot['games']} L{slot['lines']:04}"
+	slot['window'].addstr(0, 1, label[:2 * PLAY_AREA_WIDTH])
+	slot['window'].noutrefresh()
+
+
+def bot_steps_driver(board):
+	# bots move their blocks down on their own - gravity is not used
+	for key in bot_driver(board):
+		yield key, False
+
+
+def replay_driver(path, board):
+	"""
+	Generator of steps read from replay file. Replay file contains names of keys (see REPLAY_KEYS) separated by
+	whitespaces, one key per frame, optionally followed by REPLAY_TICK_SUFFIX when the gravity interval was completed in
+	that frame; lines starting with # are ignored.
+	"""
+	with open(path) as replay_file:
+		for line in replay_file:
+			if line.startswith("#"):
+				continue
+
+			for step_name in line.split():
+				yield parse_replay_step(step_name)
+
+
+def parse_replay_step(step_name):
+	"""
+	:return: tuple (key, interval_completed)
+	"""
+	interval_completed = step_name.endswith(REPLAY_TICK_SUFFIX)
+	key_name = step_name[:-len(REPLAY_TICK_SUFFIX)] if interval_completed else step_name
+
+	return REPLAY_KEYS[key_name], interval_completed
+
+
+def format_replay_step(key, interval_completed):
+	key_name = KEY_NAMES[key]
+
+	return key_name + REPLAY_TICK_SUFFIX if interval_completed else key_name
+
+
+def setup_wall_window(window):
+	window.keypad(True)
+	window.nodelay(True)
+	init_colors()
+	title = "Command Line Tetris Wall"
+	height, width = window.getmaxyx()
+	window.addstr(0, width // 2 - len(title) // 2, title)
+	window.noutrefresh()
+
+	# no cursor
+	curses.curs_set(0)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Renders many Tetris boards driven by bots or replays.")
+	parser.add_argument("replays", nargs="*", help="replay files driving the first boards")
+	parser.add_argument("-n", "--boards", type=int, help="number of boards (default: as many as fit in the terminal)")
+	parser.add_argument("--fps", type=int, default=FRAMES_PER_SECOND, help="frames per second")
+	parser.add_argument("--randomizer", choices=RANDOMIZERS, default=DEFAULT_RANDOMIZER, help="order of pieces")
+	parser.add_argument("--seed", type=int, help="seed of the randomizer used by the first board")
+	args = parser.parse_args()
+
+	curses.wrapper(main, args.boards, args.replays, args.fps, args.randomizer, args.seed)